@@ -234,9 +234,9 @@ _C.DATASETS.MAPPING = "datagen/front3d/nyu40labels_suncg.csv"
 
 _C.DATASETS.FRUSTUM_DIMENSIONS = [256, 256, 256]
 
-_C.DATASETS.FIELDS = ["color", "depth", "instances2d", "geometry"]
+_C.DATASETS.FIELDS = ["color", "depth", "instance2d", "geometry"]
 
-# List of the dataset names for training, as present in paths_catalog.py
+# List of the dataset names for training, as present in path_catalog.py
 _C.DATASETS.TRAIN = ()
 _C.DATASETS.VAL = ()
 _C.DATASETS.TRAINVAL = ()
@@ -248,6 +248,10 @@ _C.DATASETS.TEST = ()
 _C.DATALOADER = Node()
 # Number of data loading threads
 _C.DATALOADER.NUM_WORKERS = 4
+# Number of batches loaded in advance by each worker
+_C.DATALOADER.PREFETCH_FACTOR = 4
+# Keep workers alive between epochs instead of re-creating the dataset
+_C.DATALOADER.PERSISTENT_WORKERS = True
 _C.DATALOADER.IMS_PER_BATCH = 1
 _C.DATALOADER.SHUFFLE = True
 _C.DATALOADER.AUGMENTATION = False
@@ -285,5 +289,5 @@ _C.TEST.DETECTIONS_PER_IMG = 100
 # ---------------------------------------------------------------------------- #
 # Misc options
 # ---------------------------------------------------------------------------- #
-_C.PATHS_CATALOG = os.path.join(os.path.dirname(__file__), "paths_catalog.py")
+_C.PATHS_CATALOG = os.path.join(os.path.dirname(__file__), "path_catalog.py")
 _C.OUTPUT_DIR = "."
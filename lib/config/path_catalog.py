@@ -51,6 +51,30 @@ class DatasetCatalog:
             "file_list_path": "resources/front3d/test_list_3d.txt",
             "dataset_root_path": "data/front3d/",
             "factory": "Front3D"
+        },
+
+        # ------------------------------------------------------------------
+        # 3D-FRONT, packed with tools/pack_front3d.py
+        # ------------------------------------------------------------------
+        "Front3D_Train_Packed": {
+            "file_list_path": "resources/front3d/train_list_3d.txt",
+            "dataset_root_path": "data/front3d/",
+            "shard_path": "data/front3d-packed/train/",
+            "factory": "Front3D"
+        },
+
+        "Front3D_Validation_Packed": {
+            "file_list_path": "resources/front3d/validation_list_3d.txt",
+            "dataset_root_path": "data/front3d/",
+            "shard_path": "data/front3d-packed/validation/",
+            "factory": "Front3D"
+        },
+
+        "Front3D_Test_Packed": {
+            "file_list_path": "resources/front3d/test_list_3d.txt",
+            "dataset_root_path": "data/front3d/",
+            "shard_path": "data/front3d-packed/test/",
+            "factory": "Front3D"
         }
     }
 
@@ -1,4 +1,6 @@
 from .build import setup_dataloader
+from .datasets import Front3D, Front3DPrefetcher
 from .io import read_dense_distance_field, read_dense_segmentation, read_spare_distance_field, \
-    read_sparse_distance_field_to_dense, read_spare_segmentation, read_sparse_segmentation_to_dense
+    read_sparse_distance_field_to_dense, read_spare_segmentation, read_sparse_segmentation_to_dense, \
+    read_exr_channel, write_packed_shard, read_packed_index, read_packed_field
 
@@ -21,14 +21,23 @@ def setup_dataloader(dataset_name, is_train=True, start_iteration=0, is_iteratio
     batch_size = config.DATALOADER.IMS_PER_BATCH if is_train else 1
     batch_sampler = samplers.make_batch_data_sampler(sampler, batch_size, config.DATALOADER.MAX_ITER, start_iteration,
                                                      iteration_based=iteration_based)
-    collator = collate.BatchCollator()
+    collator = collate.fast_fieldlist_collate
+
+    # Worker options are only accepted by the DataLoader when loading in subprocesses
+    worker_args = {}
+    if config.DATALOADER.NUM_WORKERS > 0:
+        worker_args = {
+            "persistent_workers": config.DATALOADER.PERSISTENT_WORKERS,
+            "prefetch_factor": config.DATALOADER.PREFETCH_FACTOR
+        }
 
     data_loader = data.DataLoader(
         dataset,
         num_workers=config.DATALOADER.NUM_WORKERS,
         batch_sampler=batch_sampler,
         collate_fn=collator,
-        pin_memory=pin_memory
+        pin_memory=pin_memory,
+        **worker_args
     )
 
     return data_loader
@@ -38,7 +47,8 @@ def build_dataset(dataset_name) -> data.Dataset:
     paths_catalog = import_file("lib.config.paths_catalog", config.PATHS_CATALOG, True)
     dataset_catalog = paths_catalog.DatasetCatalog
 
-    info = dataset_catalog.get(dataset_name)
+    # Copy the entry, the catalog is shared by all datasets built in this process
+    info = dict(dataset_catalog.get(dataset_name))
     factory = getattr(datasets, info.pop("factory"))
     info["fields"] = config.DATASETS.FIELDS
 
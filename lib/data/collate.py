@@ -1,13 +1,41 @@
 # Copyright (c) Facebook, Inc. and its affiliates. All Rights Reserved.
+from typing import List, Tuple
 
+import torch
+from torch.utils import data
 
-class BatchCollator:
-    def __call__(self, batch):
-        transposed_batch = list(zip(*[sample for sample in batch if sample[0] is not None]))
+from lib.structures import FieldList, FieldListBatch
 
-        if len(transposed_batch) == 0:
-            return "error", None
-        else:
-            targets = transposed_batch[0]
-            img_ids = transposed_batch[1]
-        return img_ids, targets
+
+def fast_fieldlist_collate(batch: List[FieldList]) -> Tuple[List[str], FieldListBatch]:
+    """
+    Collates FieldList samples into a FieldListBatch.
+    Inside a worker, every tensor field is stacked into one tensor in shared memory, which is sent to the main
+    process without a copy and pinned and transferred once per field, each sample keeps a view of its slice.
+    In the main process stacking would only add a copy, so the samples are passed on as they are.
+    Tensors which are shared by all samples, e.g. the frustum mask, are recorded once as shared fields of the batch,
+    non-tensor fields are passed on unchanged.
+    """
+    image_ids = [sample.get_field("name") for sample in batch]
+    in_worker = data.get_worker_info() is not None
+    batched_fields = {}
+    shared_fields = {}
+
+    for field in batch[0].fields():
+        values = [sample.get_field(field) for sample in batch]
+        elem = values[0]
+
+        if not all(torch.is_tensor(value) and value.shape == elem.shape for value in values):
+            continue
+
+        if all(value is elem for value in values):
+            shared_fields[field] = elem
+            continue
+
+        if in_worker:
+            # Allocate directly in shared memory to avoid a copy when sending the batch to the main process
+            storage = elem.storage()._new_shared(len(values) * elem.numel())
+            out = elem.new(storage).view(len(values), *elem.shape)
+            batched_fields[field] = torch.stack(values, 0, out=out)
+
+    return image_ids, FieldListBatch(batch, batched_fields, shared_fields)
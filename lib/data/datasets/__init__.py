@@ -0,0 +1 @@
+from .front3d import Front3D, Front3DPrefetcher
@@ -1,42 +1,81 @@
+import hashlib
 import os
+import pickle
 import random
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, Union, List
+from typing import Dict, Union, List, Optional, Tuple
 
 import numpy as np
 import torch.utils.data
 from PIL import Image
-import pyexr
 
-from lib import data, config
+from lib import data, config, logger
 from lib.data import transforms2d as t2d
 from lib.data import transforms3d as t3d
-from lib.structures import FieldList
+from lib.structures import FieldList, FieldListBatch, DepthMap
 
 _imagenet_stats = {'mean': [0.485, 0.456, 0.406], 'std': [0.229, 0.224, 0.225]}
 
+# Files which have to exist for a sample, depending on the requested fields
+_required_records = {
+    "color": ["color"],
+    "depth": ["depth"],
+    "instance2d": ["segmentation2d"],
+    "geometry": ["geometry", "weighting"],
+    "semantic3d": ["segmentation3d", "weighting"],
+    "instance3d": ["segmentation3d", "weighting"]
+}
+
 
 class Front3D(torch.utils.data.Dataset):
     def __init__(self, file_list_path: os.PathLike, dataset_root_path: os.PathLike, fields: List[str],
-                 num_samples: int = None, shuffle: bool = False) -> None:
+                 num_samples: int = None, shuffle: bool = False, shard_path: os.PathLike = None) -> None:
         super().__init__()
 
         self.dataset_root_path = Path(dataset_root_path)
 
+        # Fields defines which data should be loaded
+        self.fields = fields if fields is not None else ["color", "depth", "instance2d", "geometry", "semantic3d",
+                                                         "instance3d"]
+
+        # 3D instances are mapped consistently to the shuffled 2D instance ids
+        if "instance3d" in self.fields and "instance2d" not in self.fields:
+            raise ValueError("Field 'instance3d' requires field 'instance2d' to be loaded")
+
         self.samples: List = self.load_and_filter_file_list(file_list_path)
 
+        # Optionally read all samples from packed chunks, see tools/pack_front3d.py
+        # Chunks are opened on demand, each worker keeps only a few recently used ones mapped
+        self.shard_path = shard_path
+        self.idx: Optional[Dict] = None
+
+        if shard_path is None:
+            self.samples = self.filter_incomplete_samples(file_list_path, self.fields)
+        else:
+            # The packer skips incomplete samples, keep only the ones present in the shard
+            self.idx = data.read_packed_index(shard_path)
+            packed_samples = [sample for sample in self.samples if sample in self.idx["samples"]]
+
+            if len(packed_samples) != len(self.samples):
+                logger.info(f"Dropped {len(self.samples) - len(packed_samples)} of {len(self.samples)} samples "
+                            f"missing from shard {shard_path}")
+
+            self.samples = packed_samples
+
         if shuffle:
             random.shuffle(self.samples)
 
         self.samples = self.samples[:num_samples]
 
-        # Fields defines which data should be loaded
-        if fields is None:
-            self.fields = fields
+        # Split sample names and build all file paths once instead of per sample
+        self._record_paths: List[Dict[str, str]] = self.build_record_paths()
 
         self.image_size = (320, 240)
         self.depth_image_size = (160, 120)
-        self.intrinsic = config.MODEL.PROJECTION.INTRINSIC
+        # Constant camera parameters, materialized once and shared by all depth maps
+        self.intrinsic = torch.tensor(config.MODEL.PROJECTION.INTRINSIC, dtype=torch.float32)
+        self._intrinsic_inverse = torch.inverse(self.intrinsic)
         self.voxel_size = config.MODEL.PROJECTION.VOXEL_SIZE
         self.depth_min = config.MODEL.PROJECTION.DEPTH_MIN
         self.depth_max = config.MODEL.PROJECTION.DEPTH_MAX
@@ -46,88 +85,70 @@ class Front3D(torch.utils.data.Dataset):
         self.num_min_instance_pixels = config.MODEL.INSTANCE2D.MIN_PIXELS
         self.stuff_classes = [0, 10, 11, 12]
 
+        # The mask is constant and shared read-only by all samples and workers
         self.frustum_mask: torch.Tensor = self.load_frustum_mask()
+        self.frustum_mask.share_memory_()
+
+        # Per-file reads of a sample are overlapped in a small thread pool, which is created lazily per worker
+        self._io_pool: Optional[ThreadPoolExecutor] = None
+        self._io_pool_pid: Optional[int] = None
 
         self.transforms: Dict = self.define_transformations()
+        self.hierarchy_transforms: Dict = self.define_hierarchy_transformations()
 
     def __getitem__(self, index) -> FieldList:
-        sample_path = self.samples[index]
-        scene_id = sample_path.split("/")[0]
-        image_id = sample_path.split("/")[1]
-
         sample = FieldList(self.image_size, mode="xyxy")
         sample.add_field("index", index)
-        sample.add_field("name", sample_path)
+        sample.add_field("name", self.samples[index])
+
+        # Issue all reads first, the transforms below wait for their results
+        raw = self.submit_loads(index)
 
         # 2D data
         if "color" in self.fields:
-            color = Image.open(self.dataset_root_path / scene_id / f"rgb_{image_id}.png", formats=["PNG"])
+            color = raw["color"].result()
             color = self.transforms["color"](color)
             sample.add_field("color", color)
 
         if "depth" in self.fields:
-            depth = pyexr.read(str(self.dataset_root_path / scene_id / f"depth_{image_id}.exr")).squeeze()[::-1, ::-1].copy()
+            depth = raw["depth"].result()
             depth = self.transforms["depth"](depth)
             sample.add_field("depth", depth)
 
         if "instance2d" in self.fields:
-            segmentation2d = np.load(self.dataset_root_path / scene_id / f"segmap_{image_id}.mapped.npz")
+            segmentation2d = raw["segmentation2d"].result()
             instance2d = self.transforms["instance2d"](segmentation2d)
             sample.add_field("instance2d", instance2d)
 
         # 3D data
-        needs_weighting = False
         if "geometry" in self.fields:
-            geometry_path = self.dataset_root_path / scene_id / f"geometry_{image_id}.df"
-            geometry = data.read_sparse_distance_field_to_dense(geometry_path, 12)
+            geometry = raw["geometry"].result()
             geometry = self.transforms["geometry"](geometry)
 
-            # process hierarchy
-            sample.add_field("occupancy_256", self.transforms["occupancy_256"](geometry))
-            sample.add_field("occupancy_128", self.transforms["occupancy_128"](geometry))
-            sample.add_field("occupancy_64", self.transforms["occupancy_64"](geometry))
-
-            geometry = self.transforms["geometry_truncate"](geometry)
+            # occupancy hierarchy and final truncation are computed on the GPU, see Front3DPrefetcher
             sample.add_field("geometry", geometry)
 
             # add frustum mask
-            sample.add_field("frustum_mask", self.frustum_mask.clone())
-
-            needs_weighting = True
+            sample.add_field("frustum_mask", self.frustum_mask)
 
-        if "semantic3d" or "instance3d" in self.fields:
-            segmentation3d_path = self.dataset_root_path / scene_id / f"segmentation_{image_id}.mapped.sem"
-            semantic3d, instance3d = data.read_sparse_segmentation_to_dense(segmentation3d_path, 1000, 0)
-            needs_weighting = True
+        if "semantic3d" in self.fields or "instance3d" in self.fields:
+            semantic3d, instance3d = raw["segmentation3d"].result()
 
             if "semantic3d" in self.fields:
                 semantic3d = self.transforms["semantic3d"](semantic3d)
                 sample.add_field("semantic3d", semantic3d)
 
-                # process semantic3d hierarchy
-                sample.add_field("semantic3d_128", self.transforms["segmentation3d_128"](semantic3d))
-                sample.add_field("semantic3d_64", self.transforms["segmentation3d_64"](semantic3d))
-
             if "instance3d" in self.fields:
                 # Ensure consistent instance id shuffle between 2D and 3D instances
                 instance_mapping = sample.get_field("instance2d").get_field("instance_locations")
                 instance3d = self.transforms["instance3d"](instance3d, {"mapping": instance_mapping})
                 sample.add_field("instance3d", instance3d)
 
-                # process instance3d hierarchy
-                sample.add_field("instance3d_128", self.transforms["segmentation3d_128"](instance3d))
-                sample.add_field("instance3d_64", self.transforms["segmentation3d_64"](instance3d))
-
-        if needs_weighting:
-            weighting_path = self.dataset_root_path / scene_id / f"weighting_{image_id}.df"
-            weighting, _ = data.read_sparse_distance_field_to_dense(weighting_path, 1.0)
+        if "weighting" in raw:
+            weighting = raw["weighting"].result()
             weighting = self.transforms["weighting"](weighting)
             sample.add_field("weighting3d", weighting)
 
-            # Process weighting mask hierarchy
-            sample.add_field("weighting3d_128", self.transforms["weighting3d_128"](weighting))
-            sample.add_field("weighting3d_64", self.transforms["weighting3d_128"](weighting))
-
         return sample
 
     def __len__(self) -> int:
@@ -135,13 +156,175 @@ class Front3D(torch.utils.data.Dataset):
 
     @staticmethod
     def load_and_filter_file_list(file_list_path: os.PathLike) -> List[str]:
-        with open(file_list_path) as f:
-            content = f.readlines()
-
-        images = [line.strip() for line in content]
+        images = Path(file_list_path).read_text().splitlines()
 
         return images
 
+    def submit_loads(self, index: int) -> Dict[str, Future]:
+        loaders = {
+            "color": self.load_color,
+            "depth": self.load_depth,
+            "segmentation2d": self.load_segmentation2d,
+            "geometry": self.load_geometry,
+            "segmentation3d": self.load_segmentation3d,
+            "weighting": self.load_weighting
+        }
+
+        records = {record for field in self.fields for record in _required_records.get(field, [])}
+        futures = {}
+
+        for record in records:
+            # Slicing the packed shard is cheap, only per-file reads are worth a thread
+            if self.shard_path is not None:
+                futures[record] = Future()
+                futures[record].set_result(loaders[record](index))
+            else:
+                futures[record] = self.get_io_pool().submit(loaders[record], index)
+
+        return futures
+
+    def get_io_pool(self) -> ThreadPoolExecutor:
+        # Threads do not survive forking the data loader workers, create a new pool in each process
+        if self._io_pool is None or self._io_pool_pid != os.getpid():
+            self._io_pool = ThreadPoolExecutor(max_workers=4)
+            self._io_pool_pid = os.getpid()
+
+        return self._io_pool
+
+    def read_packed_field(self, index: int, field: str) -> np.array:
+        return data.read_packed_field(self.shard_path, self.idx, self.samples[index], field)
+
+    def filter_incomplete_samples(self, file_list_path: os.PathLike, fields: List[str]) -> List[str]:
+        # Cache the result per file list, dataset and requested fields, each combination has its own file
+        cache_key = (str(file_list_path), os.path.getmtime(file_list_path), str(self.dataset_root_path),
+                     sorted(fields))
+        cache_hash = hashlib.sha1(repr(cache_key).encode()).hexdigest()[:16]
+        cache_path = Path(file_list_path).with_suffix(f".{cache_hash}.cache.pkl")
+
+        # A missing, unreadable or corrupt cache is a miss
+        try:
+            with open(cache_path, "rb") as f:
+                cache = pickle.load(f)
+
+            if cache["key"] == cache_key:
+                return cache["samples"]
+        except Exception:
+            pass
+
+        records = sorted({record for field in fields for record in _required_records.get(field, [])})
+
+        def find_missing_path(sample_path: str) -> Optional[str]:
+            record_paths = self.get_record_paths(sample_path)
+
+            for record in records:
+                path = record_paths[record]
+
+                # Segmaps may not have been converted to uncompressed .npy, see load_segmentation2d
+                if not os.path.exists(path) and not (record == "segmentation2d" and
+                                                     os.path.exists(path[:-len(".npy")] + ".npz")):
+                    return path
+
+            return None
+
+        with ThreadPoolExecutor(64) as executor:
+            missing_paths = list(executor.map(find_missing_path, self.samples))
+
+        samples = [sample for sample, missing_path in zip(self.samples, missing_paths) if missing_path is None]
+        missing = [missing_path for missing_path in missing_paths if missing_path is not None]
+
+        if len(samples) == 0 and len(self.samples) > 0:
+            raise FileNotFoundError(f"None of the {len(self.samples)} samples of {file_list_path} is complete in "
+                                    f"{self.dataset_root_path}, e.g. {missing[0]} does not exist")
+
+        if len(missing) > 0:
+            logger.info(f"Dropped {len(missing)} of {len(self.samples)} samples with missing files, "
+                        f"e.g. {', '.join(missing[:5])}")
+
+        # Write to a temporary file and rename it, so that concurrent ranks never read a partial cache.
+        # The cache is optional, e.g. on a read-only checkout the result is just not stored.
+        temporary_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+
+        try:
+            with open(temporary_path, "wb") as f:
+                pickle.dump({"key": cache_key, "samples": samples}, f)
+
+            os.replace(temporary_path, cache_path)
+        except OSError as e:
+            logger.info(f"Could not write sample cache {cache_path}: {e}")
+
+            try:
+                temporary_path.unlink()
+            except OSError:
+                pass
+
+        return samples
+
+    def get_record_paths(self, sample_path: str) -> Dict[str, str]:
+        scene_id, image_id = sample_path.split("/")
+        scene_path = self.dataset_root_path / scene_id
+
+        return {
+            "color": str(scene_path / f"rgb_{image_id}.png"),
+            "depth": str(scene_path / f"depth_{image_id}.exr"),
+            "segmentation2d": str(scene_path / f"segmap_{image_id}.mapped.npy"),
+            "geometry": str(scene_path / f"geometry_{image_id}.df"),
+            "segmentation3d": str(scene_path / f"segmentation_{image_id}.mapped.sem"),
+            "weighting": str(scene_path / f"weighting_{image_id}.df")
+        }
+
+    def build_record_paths(self) -> List[Dict[str, str]]:
+        return [self.get_record_paths(sample_path) for sample_path in self.samples]
+
+    def load_color(self, index: int) -> Union[Image.Image, np.array]:
+        if self.shard_path is not None:
+            return self.read_packed_field(index, "color")
+
+        # Decode now, PIL would otherwise defer decoding until the first access in the transforms
+        color = Image.open(self._record_paths[index]["color"], formats=["PNG"])
+        color.load()
+        return color
+
+    def load_depth(self, index: int) -> np.array:
+        if self.shard_path is not None:
+            # Stored flipped and contiguous, the float16 view is passed on without a copy
+            return self.read_packed_field(index, "depth")
+
+        # Read-only view of the decoded channel, flipping allocates the only copy
+        depth = data.read_exr_channel(self._record_paths[index]["depth"])
+        return depth[::-1, ::-1].copy()
+
+    def load_segmentation2d(self, index: int) -> np.array:
+        if self.shard_path is not None:
+            return self.read_packed_field(index, "segmentation2d")
+
+        # Uncompressed segmaps are memory-mapped, see tools/convert_front3d_segmaps.py
+        segmentation2d_path = self._record_paths[index]["segmentation2d"]
+
+        try:
+            return np.load(segmentation2d_path, mmap_mode="r")
+        except FileNotFoundError:
+            return np.load(segmentation2d_path[:-len(".npy")] + ".npz")["data"]
+
+    def load_geometry(self, index: int) -> np.array:
+        if self.shard_path is not None:
+            return self.read_packed_field(index, "geometry")
+
+        return data.read_sparse_distance_field_to_dense(self._record_paths[index]["geometry"], 12, np.float16)
+
+    def load_segmentation3d(self, index: int) -> Tuple[np.array, np.array]:
+        if self.shard_path is not None:
+            semantic3d = self.read_packed_field(index, "semantic3d")
+            instance3d = self.read_packed_field(index, "instance3d")
+            return semantic3d, instance3d
+
+        return data.read_sparse_segmentation_to_dense(self._record_paths[index]["segmentation3d"], 1000, 0, np.int16)
+
+    def load_weighting(self, index: int) -> np.array:
+        if self.shard_path is not None:
+            return self.read_packed_field(index, "weighting")
+
+        return data.read_sparse_distance_field_to_dense(self._record_paths[index]["weighting"], 1.0, np.float16)
+
     def load_frustum_mask(self) -> torch.Tensor:
         mask_path = self.dataset_root_path / "frustum_mask.npz"
         mask = data.read_sparse_distance_field_to_dense(mask_path, 0.0)
@@ -153,31 +336,38 @@ class Front3D(torch.utils.data.Dataset):
         transforms = dict()
 
         # 2D transforms
-        transforms["color"] = t2d.Compose([
-            t2d.ToTensor(),
-            t2d.Normalize(_imagenet_stats["mean"], _imagenet_stats["std"])
-        ])
+        # Normalization of color and resizing of depth is done on the GPU, see Front3DPrefetcher
+        transforms["color"] = t2d.ToTensorUint8()
 
         transforms["depth"] = t2d.Compose([
-            t2d.ToImage(),
-            t2d.Resize(self.depth_image_size, Image.NEAREST),
-            t2d.ToNumpyArray(),
             t2d.ToTensorFromNumpy(),
-            t2d.ToDepthMap(self.intrinsic)  # 3D-Front has single intrinsic matrix
+            t2d.ToDepthMap(self.intrinsic, None, self._intrinsic_inverse)  # 3D-Front has single intrinsic matrix
         ])
 
         transforms["instance2d"] = t2d.Compose([
             t2d.SegmentationToMasks(self.image_size, self.num_min_instance_pixels, self.max_instances, True, self.stuff_classes)
         ])
 
-        # 3D transforms
-        transforms["geometry"] = t3d.Compose([
-            t3d.ToTensor(dtype=torch.float),
-            t3d.Unsqueeze(0),
-            t3d.ToTDF(truncation=12)
-        ])
+        # 3D transforms, volumes are kept in half precision and int16 until they reach the GPU
+        transforms["geometry"] = t3d.Compose([t3d.ToTensor(dtype=torch.float16), t3d.Unsqueeze(0)])
+
+        transforms["weighting"] = t3d.Compose([t3d.ToTensor(dtype=None), t3d.Unsqueeze(0)])
 
-        transforms["geometry_truncate"] = t3d.ToTDF(truncation=self.truncation)
+        transforms["semantic3d"] = t3d.Compose([t3d.ToTensor(dtype=torch.int16), t3d.Unsqueeze(0)])
+
+        transforms["instance3d"] = t3d.Compose([t3d.ToTensor(dtype=torch.int16), t3d.Unsqueeze(0),
+                                                t3d.Mapping(mapping={}, ignore_values=[0])])
+
+        return transforms
+
+    def define_hierarchy_transformations(self) -> Dict:
+        # Applied to the full resolution 3D volumes after they have been transferred to the GPU
+        transforms = dict()
+
+        # Single abs pass, the resulting TDF feeds all occupancy levels and the final truncation
+        transforms["geometry"] = t3d.ToTDF(truncation=12)
+        # Input is already non-negative, only the upper bound has to be applied
+        transforms["geometry_truncate"] = t3d.ToTSDF(truncation=self.truncation)
 
         transforms["occupancy_64"] = t3d.Compose([t3d.ResizeTrilinear(0.25), t3d.ToBinaryMask(8)])
         transforms["occupancy_128"] = t3d.Compose([t3d.ResizeTrilinear(0.5), t3d.ToBinaryMask(6)])
@@ -186,12 +376,184 @@ class Front3D(torch.utils.data.Dataset):
         transforms["weighting3d_64"] = t3d.ResizeTrilinear(0.25)
         transforms["weighting3d_128"] = t3d.ResizeTrilinear(0.5)
 
-        transforms["semantic3d"] = t3d.Compose([t3d.ToTensor(dtype=torch.int), t3d.Unsqueeze(0)])
+        transforms["segmentation3d_64"] = t3d.ResizeMax(8, 4, 2)
+        transforms["segmentation3d_128"] = t3d.ResizeMax(4, 2, 1)
 
-        transforms["instance3d"] = t3d.Compose([t3d.ToTensor(dtype=torch.int), t3d.Unsqueeze(0),
-                                                t3d.Mapping(mapping={}, ignore_values=[0])])
+        return transforms
 
-        transforms["segmentation3d_64"] = t3d.Compose([t3d.ResizeMax(8, 4, 2)])
-        transforms["segmentation3d_128"] = t3d.Compose([t3d.ResizeMax(4, 2, 1)])
 
-        return transforms
+class Front3DPrefetcher:
+    """Wraps a Front3D data loader and prepares the next batch on a separate CUDA stream.
+
+    All tensor fields are copied from pinned memory without blocking, which overlaps the transfer with the
+    forward pass of the current batch. Color images arrive as uint8 and are normalized on the GPU, depth maps are
+    resized to the depth resolution and the 3D hierarchies are built from the full resolution volumes after the
+    transfer.
+    """
+
+    def __init__(self, loader: torch.utils.data.DataLoader, device: str = "cuda") -> None:
+        self.loader = loader
+        self.device = device
+        self.stream = torch.cuda.Stream()
+
+        self.mean = torch.tensor([m * 255 for m in _imagenet_stats["mean"]], device=device).view(3, 1, 1)
+        self.std = torch.tensor([s * 255 for s in _imagenet_stats["std"]], device=device).view(3, 1, 1)
+
+        depth_width, depth_height = loader.dataset.depth_image_size
+        self.depth_size = (depth_height, depth_width)
+        self.depth_indices: Dict[Tuple[int, int], Tuple[torch.Tensor, torch.Tensor]] = {}
+        self.hierarchy_transforms = loader.dataset.hierarchy_transforms
+
+        self.iterator = None
+        self.next_batch = None
+
+    def __iter__(self):
+        self.iterator = iter(self.loader)
+        self.preload()
+
+        return self
+
+    def __next__(self):
+        torch.cuda.current_stream().wait_stream(self.stream)
+        batch = self.next_batch
+
+        if batch is None:
+            raise StopIteration
+
+        # Tensors were allocated on the side stream, mark them as used by the compute stream
+        for tensor in self.collect_tensors(batch[1]):
+            tensor.record_stream(torch.cuda.current_stream())
+
+        self.preload()
+
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.loader)
+
+    def preload(self) -> None:
+        try:
+            image_ids, targets = next(self.iterator)
+        except StopIteration:
+            self.next_batch = None
+            return
+
+        with torch.cuda.stream(self.stream):
+            # Batched and shared tensors are transferred once, the per-sample copies below are no-ops for their views
+            if isinstance(targets, FieldListBatch):
+                targets.apply(lambda tensor: tensor.to(self.device, non_blocking=True))
+
+            for target in targets:
+                for field in target.fields():
+                    value = target.get_field(field)
+
+                    if torch.is_tensor(value):
+                        target.add_field(field, value.to(self.device, non_blocking=True))
+
+                if target.has_field("depth"):
+                    depth = target.get_field("depth")
+                    depth_map = depth.depth_map.to(self.device, non_blocking=True).float()
+                    depth.depth_map = self.resize_depth(depth_map)
+
+            # The weighting is transferred in half precision and only cast after the transfer, as depth
+            self.to_float(targets, "weighting3d")
+            self.normalize_color(targets)
+
+            self.build_hierarchy(targets)
+
+        self.next_batch = image_ids, targets
+
+    @staticmethod
+    def to_float(targets: List[FieldList], field: str) -> None:
+        if isinstance(targets, FieldListBatch) and field in targets.batched_fields:
+            targets.add_batched_field(field, targets.batched_fields[field].float())
+            return
+
+        for target in targets:
+            if target.has_field(field):
+                target.add_field(field, target.get_field(field).float())
+
+    def normalize_color(self, targets: List[FieldList]) -> None:
+        # Normalize the stacked batch at once if there is one, so that FieldListBatch.collect stays consistent
+        if isinstance(targets, FieldListBatch) and "color" in targets.batched_fields:
+            color = targets.batched_fields["color"].float()
+            targets.add_batched_field("color", color.sub_(self.mean).div_(self.std))
+            return
+
+        for target in targets:
+            if target.has_field("color"):
+                color = target.get_field("color").float()
+                target.add_field("color", color.sub_(self.mean).div_(self.std))
+
+    def resize_depth(self, depth_map: torch.Tensor) -> torch.Tensor:
+        # Match PIL's nearest neighbor resize, which samples the source pixel under the center of each target pixel,
+        # i.e. floor((i + 0.5) * scale). For the 2x downsampling this picks the odd pixels 2i + 1, whereas
+        # F.interpolate(mode="nearest") picks floor(i * scale) = 2i and shifts the depth by one pixel.
+        shape = tuple(depth_map.shape)
+
+        if shape not in self.depth_indices:
+            self.depth_indices[shape] = tuple(
+                ((torch.arange(target_size, device=self.device, dtype=torch.float64) + 0.5) * source_size / target_size)
+                .floor().long()
+                for source_size, target_size in zip(shape, self.depth_size))
+
+        rows, columns = self.depth_indices[shape]
+
+        return depth_map.index_select(0, rows).index_select(1, columns)
+
+    def build_hierarchy(self, targets: List[FieldList]) -> None:
+        # Stacked volumes are processed for the whole batch at once, each sample receives views of the results
+        batched_fields = set()
+
+        if isinstance(targets, FieldListBatch):
+            batched_fields = set(targets.batched_fields)
+
+            for field, tensor in self.compute_hierarchy(targets.batched_fields).items():
+                targets.add_batched_field(field, tensor)
+
+        # Volumes which were not stacked, i.e. when collating in the main process, are processed per sample
+        for target in targets:
+            volumes = {field: target.get_field(field) for field in target.fields() if field not in batched_fields}
+
+            for field, tensor in self.compute_hierarchy(volumes).items():
+                target.add_field(field, tensor)
+
+    def compute_hierarchy(self, volumes: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        # Works on single (1, D, H, W) volumes as well as stacked (B, 1, D, H, W) batches
+        transforms = self.hierarchy_transforms
+        hierarchy = {}
+
+        if "geometry" in volumes:
+            distance_field = transforms["geometry"](volumes["geometry"])
+            hierarchy["occupancy_256"] = transforms["occupancy_256"](distance_field)
+            hierarchy["occupancy_128"] = transforms["occupancy_128"](distance_field)
+            hierarchy["occupancy_64"] = transforms["occupancy_64"](distance_field)
+            hierarchy["geometry"] = transforms["geometry_truncate"](distance_field)
+
+        for field in ["semantic3d", "instance3d"]:
+            if field in volumes:
+                hierarchy[f"{field}_128"] = transforms["segmentation3d_128"](volumes[field])
+                hierarchy[f"{field}_64"] = transforms["segmentation3d_64"](volumes[field])
+
+        if "weighting3d" in volumes:
+            hierarchy["weighting3d_128"] = transforms["weighting3d_128"](volumes["weighting3d"])
+            hierarchy["weighting3d_64"] = transforms["weighting3d_64"](volumes["weighting3d"])
+
+        return hierarchy
+
+    @staticmethod
+    def collect_tensors(targets: List[FieldList]) -> List[torch.Tensor]:
+        # Deduplicated by identity, shared tensors are referenced by every target
+        tensors = {}
+
+        for target in targets:
+            for field in target.fields():
+                value = target.get_field(field)
+
+                if isinstance(value, DepthMap):
+                    value = value.depth_map
+
+                if torch.is_tensor(value):
+                    tensors[id(value)] = value
+
+        return list(tensors.values())
@@ -1,8 +1,13 @@
+import functools
 import os
+import pickle
 import struct
-from typing import Tuple, List
+from pathlib import Path
+from typing import Tuple, List, Dict, Iterable
 
+import Imath
 import numpy as np
+import OpenEXR
 
 TYPE_NAMES = {
     "int8": "b",
@@ -83,10 +88,10 @@ def read_spare_distance_field(file_path: os.PathLike) -> Tuple[List, np.array, n
     return [dim_x, dim_y, dim_z], locations, values
 
 
-def read_sparse_distance_field_to_dense(file_path: os.PathLike, default_value: float = 0.0) -> np.array:
+def read_sparse_distance_field_to_dense(file_path: os.PathLike, default_value: float = 0.0, dtype=float) -> np.array:
     (dim_x, dim_y, dim_z), locations, values = read_spare_distance_field(file_path)
 
-    grid = np.full((dim_x, dim_y, dim_z), fill_value=default_value, dtype=np.float)
+    grid = np.full((dim_x, dim_y, dim_z), fill_value=default_value, dtype=dtype)
     grid[locations[:, 0], locations[:, 1], locations[:, 2]] = values
 
     return grid
@@ -122,13 +127,101 @@ def read_spare_segmentation(file_path: os.PathLike, offset_value: int = 1000) ->
 
 
 def read_sparse_segmentation_to_dense(file_path: os.PathLike, offset_value: int = 1000,
-                                      default_value: int = 0) -> Tuple[np.array, np.array]:
+                                      default_value: int = 0, dtype=np.uint32) -> Tuple[np.array, np.array]:
     [dim_x, dim_y, dim_z], locations, semantic, instance = read_spare_segmentation(file_path, offset_value)
 
-    semantic_grid = np.full_like((dim_x, dim_y, dim_z), dtype=np.uint32, fill_value=default_value)
+    semantic_grid = np.full((dim_x, dim_y, dim_z), dtype=dtype, fill_value=default_value)
     semantic_grid[locations[:, 0], locations[:, 1], locations[:, 2]] = semantic
 
-    instance_grid = np.full_like((dim_x, dim_y, dim_z), dtype=np.uint32, fill_value=default_value)
+    instance_grid = np.full((dim_x, dim_y, dim_z), dtype=dtype, fill_value=default_value)
     instance_grid[locations[:, 0], locations[:, 1], locations[:, 2]] = instance
 
     return semantic_grid, instance_grid
+
+
+def read_exr_channel(file_path: os.PathLike, channel: str = None) -> np.array:
+    exr_file = OpenEXR.InputFile(str(file_path))
+    header = exr_file.header()
+
+    data_window = header["dataWindow"]
+    width = data_window.max.x - data_window.min.x + 1
+    height = data_window.max.y - data_window.min.y + 1
+
+    # Depth images store a single channel
+    if channel is None:
+        channel = next(iter(header["channels"]))
+
+    values = exr_file.channel(channel, Imath.PixelType(Imath.PixelType.FLOAT))
+    exr_file.close()
+
+    return np.frombuffer(values, dtype=np.float32).reshape(height, width)
+
+
+def write_packed_shard(shard_path: os.PathLike, records: Iterable[Tuple[str, Dict[str, np.array]]],
+                       chunk_size: int = 256 * 1024 ** 2) -> None:
+    """Write all records into fixed-layout binary chunks with a shared index.
+
+    Every record maps field names to arrays of a fixed dtype and shape. The raw bytes of a record are appended to
+    ``<shard>/chunk_{k:05d}.bin``, a new chunk is started once the current one exceeds ``chunk_size`` bytes.
+    The index ``<shard>/index.idx`` stores the (chunk, offset, length) of each field per sample.
+    """
+    shard_path = Path(shard_path)
+    shard_path.mkdir(exist_ok=True, parents=True)
+
+    fields = {}
+    samples = {}
+    offsets = {}
+    chunk_id = 0
+    f = open(shard_path / f"chunk_{chunk_id:05d}.bin", "wb")
+
+    try:
+        for sample_name, record in records:
+            if f.tell() >= chunk_size:
+                f.close()
+                chunk_id += 1
+                f = open(shard_path / f"chunk_{chunk_id:05d}.bin", "wb")
+
+            samples[sample_name] = len(samples)
+
+            for field, array in record.items():
+                array = np.ascontiguousarray(array)
+                specification = (array.dtype.str, array.shape)
+
+                if fields.setdefault(field, specification) != specification:
+                    raise ValueError(f"Field {field} of {sample_name} has layout {specification}, "
+                                     f"expected {fields[field]}")
+
+                offsets.setdefault(field, []).append((chunk_id, f.tell(), array.nbytes))
+                array.tofile(f)
+    finally:
+        f.close()
+
+    index = {
+        "num_chunks": chunk_id + 1,
+        "fields": fields,
+        "samples": samples,
+        "offsets": {field: np.asarray(values, dtype=np.int64) for field, values in offsets.items()}
+    }
+
+    with open(shard_path / "index.idx", "wb") as f:
+        pickle.dump(index, f)
+
+
+def read_packed_index(shard_path: os.PathLike) -> Dict:
+    with open(Path(shard_path) / "index.idx", "rb") as f:
+        return pickle.load(f)
+
+
+@functools.lru_cache(maxsize=16)
+def _open_packed_chunk(chunk_path: str) -> np.memmap:
+    # Every map holds a file descriptor, a split spans thousands of chunks, so only the recently used ones stay open.
+    # The cache is per process, evicted maps are closed once no array references them anymore.
+    return np.memmap(chunk_path, dtype=np.uint8, mode="r")
+
+
+def read_packed_field(shard_path: os.PathLike, index: Dict, sample_name: str, field: str) -> np.array:
+    dtype, shape = index["fields"][field]
+    chunk_id, offset, length = index["offsets"][field][index["samples"][sample_name]]
+    chunk = _open_packed_chunk(os.path.join(shard_path, f"chunk_{chunk_id:05d}.bin"))
+
+    return np.frombuffer(chunk[offset:offset + length], dtype=dtype).reshape(shape)
@@ -70,11 +70,15 @@ class FromDistanceToDepth:
 
 
 class ToDepthMap:
-    def __init__(self, intrinsic):
+    def __init__(self, intrinsic, dtype=torch.float, intrinsic_inverse=None):
         self.intrinsic = intrinsic
+        self.dtype = dtype
+        self.intrinsic_inverse = intrinsic_inverse
 
     def __call__(self, tensor: torch.Tensor) -> DepthMap:
-        depth_map = DepthMap(tensor.float(), self.intrinsic)
+        if self.dtype is not None:
+            tensor = tensor.to(self.dtype)
+        depth_map = DepthMap(tensor, self.intrinsic, self.intrinsic_inverse)
         return depth_map
 
 
@@ -289,6 +293,22 @@ class ToTensor:
             return img
 
 
+class ToTensorUint8:
+    """Convert a ``PIL.Image`` or ``numpy.ndarray`` (H x W x C) to a torch.ByteTensor of shape (C x H x W).
+    Values stay in the range [0, 255], scaling and normalization are left to the GPU.
+    """
+
+    def __call__(self, image):
+        if not (_is_pil_image(image) or _is_numpy_image(image)):
+            raise TypeError(
+                'pic should be PIL Image or ndarray. Got {}'.format(type(image)))
+
+        if _is_pil_image(image):
+            image = np.asarray(image.convert("RGB"))
+
+        return torch.from_numpy(np.ascontiguousarray(image.transpose((2, 0, 1)), dtype=np.uint8))
+
+
 class Normalize:
     def __init__(self, mean, std):
         self.mean = mean
@@ -353,7 +373,8 @@ class SegmentationToMasks:
         self.shuffle_instance_ids = shuffle_instance_ids
 
         if ignore_classes is None:
-            self.ignore_classes = []
+            ignore_classes = []
+        self.ignore_classes = ignore_classes
 
     def __call__(self, segmentation_image: np.array):
         # Segmentation file stores at channels
@@ -362,64 +383,54 @@ class SegmentationToMasks:
         semantic_image = segmentation_image[..., 0]
         instance_image = segmentation_image[..., 1]
 
-        labels = []
-        bounding_boxes = []
-        masks = []
-        unique_ids = np.unique(instance_image).astype(np.uint32)
-
-        # Iterate over all unique instances
-        enumerated_instance_indices = {}
-
         # Start at index 1 to leave space for 3D freespace 0-label
         randomized_indices = list(range(1, self.max_instances + 1))
 
         if self.shuffle_instance_ids:
             random.shuffle(randomized_indices)
 
-        instance_mapping = []
-
-        # Manually count in case instances are skipped
-        instance_counter = 0
-
-        for instance_id in unique_ids:
-            # Stop when max valid instances are found
-            if instance_counter >= len(randomized_indices):
-                break
-
-            # Get current instance mask
-            instance_mask: np.array = instance_image == instance_id
-            num_instance_pixels = np.sum(instance_mask)
-            instance_coordinates = instance_mask.nonzero()
-
-            if num_instance_pixels <= self.num_min_pixels:
-                continue
-
-            # Determine semantic label of the current instance
-            semantic_labels = semantic_image[instance_coordinates[0], instance_coordinates[1]]
-            unique_semantic_labels, semantic_label_count = np.unique(semantic_labels, return_counts=True)
-            max_semantic_label = np.argmax(semantic_label_count)
-            semantic_label = unique_semantic_labels[max_semantic_label]
-
-            if semantic_label in self.ignore_classes:
-                continue
-
-            # Compute bounding box
-            min_y, min_x = np.min(instance_coordinates[0]), np.min(instance_coordinates[1])
-            max_y, max_x = np.max(instance_coordinates[0]), np.max(instance_coordinates[1])
-            bbox2d = [min_x, min_y, max_x, max_y]
+        # Count pixels and semantic labels of all instances at once
+        unique_ids, instance_indices, num_instance_pixels = np.unique(instance_image, return_inverse=True,
+                                                                      return_counts=True)
+        instance_indices = instance_indices.reshape(-1)
+        semantic_values = semantic_image.reshape(-1).astype(np.int64)
+        num_semantic_labels = int(semantic_values.max()) + 1
+
+        semantic_label_count = np.bincount(instance_indices * num_semantic_labels + semantic_values,
+                                           minlength=len(unique_ids) * num_semantic_labels)
+        semantic_label_count = semantic_label_count.reshape(len(unique_ids), num_semantic_labels)
+
+        # Determine semantic label of each instance by majority vote
+        semantic_labels = np.argmax(semantic_label_count, axis=1)
+
+        # Keep the first valid instances, skipped instances do not count towards the maximum
+        is_valid = (num_instance_pixels > self.num_min_pixels) & ~np.isin(semantic_labels, self.ignore_classes)
+        valid_ids = unique_ids[is_valid][:len(randomized_indices)].astype(np.uint32)
+        labels = semantic_labels[is_valid][:len(randomized_indices)]
+        num_instances = len(valid_ids)
+
+        if num_instances == 0:
+            width, height = self.image_size
+            bounding_boxes = BoxList(torch.zeros((0, 4)), self.image_size)
+            masks = torch.zeros((0, height, width), dtype=torch.bool)
+        else:
+            masks = instance_image[None] == valid_ids[:, None, None]
 
-            labels.append(semantic_label)
-            bounding_boxes.append(bbox2d)
-            masks.append(instance_mask)
-            enumerated_instance_indices[int(instance_id)] = instance_counter
+            # Compute bounding boxes from the occupied rows and columns of each mask
+            rows = masks.any(axis=2)
+            columns = masks.any(axis=1)
+            min_y = np.argmax(rows, axis=1)
+            max_y = rows.shape[1] - 1 - np.argmax(rows[:, ::-1], axis=1)
+            min_x = np.argmax(columns, axis=1)
+            max_x = columns.shape[1] - 1 - np.argmax(columns[:, ::-1], axis=1)
 
-            random_index = randomized_indices[instance_counter]
-            instance_mapping.append(random_index)
+            bounding_boxes = BoxList(torch.from_numpy(np.stack([min_x, min_y, max_x, max_y], axis=1)), self.image_size)
+            masks = torch.from_numpy(masks)
 
-            instance_counter += 1
+        enumerated_instance_indices = {int(instance_id): index for index, instance_id in enumerate(valid_ids)}
+        instance_mapping = randomized_indices[:num_instances]
 
-        bounding_boxes = BoxList(torch.tensor(bounding_boxes), self.image_size)
-        bounding_boxes.add_field("mask2d", SegmentationMask(torch.tensor(masks), self.image_size, mode="mask"))
+        bounding_boxes.add_field("mask2d", SegmentationMask(masks, self.image_size, mode="mask"))
         bounding_boxes.add_field("label", torch.tensor(labels, dtype=torch.int32))
         bounding_boxes.add_field("mask2d_instance", torch.tensor(instance_mapping))
         bounding_boxes.add_field("instance_locations", enumerated_instance_indices)
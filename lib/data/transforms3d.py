@@ -224,13 +224,19 @@ class ResizeTrilinear:
         }
 
     def __call__(self, volume: torch.Tensor, *args, **kwargs) -> torch.Tensor:
-        while len(volume.size()) < 5:
+        old_dim = volume.dim()
+
+        while volume.dim() < 5:
             volume = volume.unsqueeze(0)
 
         mode_args = self.mode_args.get(self.mode, {})
         resized = F.interpolate(volume, scale_factor=self.factor, mode=self.mode, **mode_args)
 
-        return resized.squeeze(0)
+        # Only remove the added dimensions, a stacked batch of size 1 keeps its batch dimension
+        while resized.dim() > max(old_dim, 4):
+            resized = resized.squeeze(0)
+
+        return resized
 
 
 class ResizeMax:
@@ -240,11 +246,11 @@ class ResizeMax:
         self.padding = padding
 
     def __call__(self, volume: torch.Tensor, *args, **kwargs) -> torch.Tensor:
-        old_dtype = volume.type()
+        old_dtype = volume.dtype
         old_dim = volume.dim()
 
         while volume.dim() < 5:
-            volume.unsqueeze_(0)
+            volume = volume.unsqueeze(0)
 
         volume = volume.to(torch.float)
 
@@ -252,7 +258,7 @@ class ResizeMax:
         resized = resized.to(old_dtype)
 
         while resized.dim() > old_dim:
-            resized.squeeze_(0)
+            resized = resized.squeeze(0)
 
         return resized
 
@@ -57,7 +57,7 @@ class Trainer:
             self.checkpoint_arguments.update(checkpoint_data)
 
         # Dataloader
-        self.dataloader = data.setup_dataloader(config.DATASETS.TRAIN)
+        self.dataloader = data.Front3DPrefetcher(data.setup_dataloader(config.DATASETS.TRAIN), config.MODEL.DEVICE)
 
     def do_train(self) -> None:
         # Log start logging
@@ -34,12 +34,13 @@ class SparseProjection(nn.Module):
         # Process each sample in the batch individually
         for idx in range(batch_size):
             # Get GT intrinsic matrix
-            intrinsic = targets[idx].get_field("depth").intrinsic_matrix
+            depth_map = targets[idx].get_field("depth")
+            intrinsic = depth_map.intrinsic_matrix
             camera2frustum = self.compute_camera2frustum_transform(intrinsic)
             camera2frustum = camera2frustum.to(device)
 
             intrinsic = intrinsic.to(device)
-            intrinsic_inverse = torch.inverse(intrinsic)
+            intrinsic_inverse = depth_map.get_intrinsic_inverse().to(device)
 
             # Mask out depth pixels which fall into another room
             if config.MODEL.PROJECTION.FILTER_ROOM_PIXELS:
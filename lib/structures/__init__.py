@@ -1,4 +1,4 @@
 from .bounding_box import BoxList
 from .depth_map import DepthMap
-from .field_list import FieldList
+from .field_list import FieldList, FieldListBatch
 from segmentation_mask import SegmentationMask, PolygonList, BinaryMaskList
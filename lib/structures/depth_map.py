@@ -5,27 +5,54 @@ from matplotlib import pyplot as plt
 
 from lib.utils.vis3d import write_pointcloud, write_pointcloud_with_normals, write_pointcloud_with_colors
 
+# Unprojection pixel grids, cached by depth map size and device
+_pixel_grids = {}
+
+
+def get_pixel_grid(height, width, device):
+    key = (height, width, str(device))
+
+    if key not in _pixel_grids:
+        yv, xv = torch.meshgrid([torch.arange(height, device=device),
+                                 torch.arange(width, device=device)])
+        _pixel_grids[key] = yv.reshape(-1).float(), xv.reshape(-1).float()
+
+    return _pixel_grids[key]
+
 
 class DepthMap(object):
-    def __init__(self, depth_map=None, intrinsic_matrix=None):
+    def __init__(self, depth_map=None, intrinsic_matrix=None, intrinsic_inverse=None):
         if isinstance(depth_map, str):
             depth_map = torch.from_numpy(np.array(Image.open(depth_map))).float() / 1000.0
         self.depth_map = depth_map
         self.intrinsic_matrix = intrinsic_matrix
+        self.intrinsic_inverse = intrinsic_inverse
 
     def load_from(self, filename):
         depth_image = torch.from_numpy(np.array(Image.open(filename))).float()
         self.depth_map = depth_image / 1000.0
 
+    def pin_memory(self):
+        self.depth_map = self.depth_map.pin_memory()
+        return self
+
     def get_tensor(self):
         return self.depth_map.clone()
 
     def set_intrinsic(self, intrinsic_matrix):
         self.intrinsic_matrix = intrinsic_matrix
+        self.intrinsic_inverse = None
 
     def get_intrinsic(self):
         return self.intrinsic_matrix.clone()
 
+    def get_intrinsic_inverse(self):
+        # The inverse is shared by all depth maps of the same camera, compute it only once
+        if self.intrinsic_inverse is None:
+            self.intrinsic_inverse = torch.inverse(self.intrinsic_matrix.float())
+
+        return self.intrinsic_inverse
+
     def save(self, filename):
         plt.imsave(filename, self.depth_map.numpy(), cmap='rainbow')
 
@@ -54,7 +81,7 @@ class DepthMap(object):
         xv = coords2d[:, 1].reshape(-1).float() * depth_map.float()
 
         coords3d = torch.stack([xv, yv, depth_map.float(), torch.ones_like(depth_map).float()])
-        pointcloud = torch.mm(torch.inverse(self.intrinsic_matrix.float()), coords3d.float()).t()[:, :3]
+        pointcloud = torch.mm(self.get_intrinsic_inverse(), coords3d.float()).t()[:, :3]
 
         return pointcloud, coords2d
 
@@ -64,13 +91,12 @@ class DepthMap(object):
         height = self.depth_map.shape[0]
         depth_map = self.depth_map.reshape(-1).float().cuda()
 
-        yv, xv = torch.meshgrid([torch.arange(height),
-                                 torch.arange(width)])
+        yv, xv = get_pixel_grid(height, width, depth_map.device)
 
-        yv = yv.reshape(-1).float().cuda() * depth_map.float()
-        xv = xv.reshape(-1).float().cuda() * depth_map.float()
+        yv = yv * depth_map.float()
+        xv = xv * depth_map.float()
         coords3d = torch.stack([xv, yv, depth_map.float(), torch.ones_like(depth_map).float().cuda()])
-        pointcloud = torch.mm(torch.inverse(self.intrinsic_matrix.float().cuda()), coords3d.float()).t()[:, :3]
+        pointcloud = torch.mm(self.get_intrinsic_inverse().cuda(), coords3d.float()).t()[:, :3]
 
         '''
            MC
@@ -2,7 +2,7 @@
 import torch
 
 # transpose
-from typing import List
+from typing import Callable, Dict, List
 
 FLIP_LEFT_RIGHT = 0
 FLIP_TOP_BOTTOM = 1
@@ -42,6 +42,13 @@ class FieldList:
         for k, v in dictionary.items():
             self.extra_fields[k] = v
 
+    def pin_memory(self):
+        for k, v in self.extra_fields.items():
+            if torch.is_tensor(v) or hasattr(v, "pin_memory"):
+                self.extra_fields[k] = v.pin_memory()
+
+        return self
+
     def copy_with_fields(self, fields, skip_missing=False):
         field_list = FieldList(self.size, self.mode)
 
@@ -76,6 +83,73 @@ class FieldList:
         return s
 
 
+class FieldListBatch:
+    """
+    A batch of FieldLists, which can be indexed, iterated and sized like a list of its samples.
+    Fields stacked into one tensor along the first dimension are kept in batched_fields, each sample holds a view
+    of its slice. Tensors which are shared by all samples, e.g. the frustum mask, are kept once in shared_fields.
+    Both are pinned and transferred once per batch instead of once per sample.
+    The batch deliberately is no Sequence, otherwise the DataLoader would pin its samples one by one.
+    """
+
+    def __init__(self, samples: List[FieldList], batched_fields: Dict[str, torch.Tensor] = None,
+                 shared_fields: Dict[str, torch.Tensor] = None) -> None:
+        self.samples = list(samples)
+        self.batched_fields = dict(batched_fields) if batched_fields is not None else {}
+        self.shared_fields = dict(shared_fields) if shared_fields is not None else {}
+
+        self.update_samples()
+
+    def apply(self, fn: Callable[[torch.Tensor], torch.Tensor]) -> "FieldListBatch":
+        """Applies fn once to every batched and shared tensor and hands the results to all samples."""
+        self.batched_fields = {field: fn(tensor) for field, tensor in self.batched_fields.items()}
+        self.shared_fields = {field: fn(tensor) for field, tensor in self.shared_fields.items()}
+        self.update_samples()
+
+        return self
+
+    def update_samples(self) -> None:
+        for index, sample in enumerate(self.samples):
+            for field, tensor in self.batched_fields.items():
+                sample.add_field(field, tensor[index])
+
+            sample.update(self.shared_fields)
+
+    def add_batched_field(self, field: str, tensor: torch.Tensor) -> None:
+        self.batched_fields[field] = tensor
+
+        for index, sample in enumerate(self.samples):
+            sample.add_field(field, tensor[index])
+
+    def collect(self, field: str, device: str = "cuda") -> torch.Tensor:
+        """Returns the field of all samples stacked along the first dimension, without a copy if it is batched."""
+        if field in self.batched_fields:
+            return self.batched_fields[field].to(device, non_blocking=True)
+
+        return collect(self.samples, field, device)
+
+    def pin_memory(self) -> "FieldListBatch":
+        self.apply(lambda tensor: tensor.pin_memory())
+
+        # Views of the batched and shared tensors are pinned already, pinning them again returns them unchanged
+        for sample in self.samples:
+            sample.pin_memory()
+
+        return self
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, item):
+        return self.samples[item]
+
+    def __iter__(self):
+        return iter(self.samples)
+
+    def __repr__(self):
+        return "{}(num_samples={})".format(self.__class__.__name__, len(self.samples))
+
+
 def collect(data: List[FieldList], field: str, device: str = "cuda", access_fn=None) -> torch.Tensor:
     if access_fn is None:
         return torch.stack([t.get_field(field).to(device, non_blocking=True) for t in data], dim=0)
@@ -0,0 +1,19 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Store compressed 3D-Front segmaps as uncompressed .npy files")
+    parser.add_argument("--dataset-root-path", type=str, required=True)
+
+    args = parser.parse_args()
+
+    for segmap_path in tqdm(sorted(Path(args.dataset_root_path).glob("**/segmap_*.mapped.npz"))):
+        np.save(segmap_path.with_suffix(".npy"), np.load(segmap_path)["data"])
+
+
+if __name__ == '__main__':
+    main()
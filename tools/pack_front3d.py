@@ -0,0 +1,54 @@
+import argparse
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from lib import config, data
+from lib.data.datasets.front3d import Front3D
+from lib.utils.imports import import_file
+
+
+def pack_samples(dataset: Front3D) -> Iterable[Tuple[str, Dict[str, np.array]]]:
+    for index, sample_path in enumerate(tqdm(dataset.samples)):
+        semantic3d, instance3d = dataset.load_segmentation3d(index)
+
+        record = {
+            "color": np.asarray(dataset.load_color(index).convert("RGB"), dtype=np.uint8),
+            # Depth is stored in its final, flipped orientation
+            "depth": dataset.load_depth(index).astype(np.float16),
+            "segmentation2d": dataset.load_segmentation2d(index).astype(np.int16),
+            "geometry": np.clip(np.abs(dataset.load_geometry(index)), 0, 12),
+            "semantic3d": semantic3d,
+            "instance3d": instance3d,
+            "weighting": dataset.load_weighting(index)
+        }
+
+        yield sample_path, record
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pack a 3D-Front split into memory-mappable chunks")
+    parser.add_argument("--config-file", type=str, default=None)
+    parser.add_argument("--dataset", type=str, required=True, help="Dataset name as present in path_catalog.py")
+    parser.add_argument("--output-path", type=str, required=True, help="Output folder of the chunks and index")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Approximate chunk size in MB")
+    parser.add_argument("opts", default=None, nargs=argparse.REMAINDER)
+
+    args = parser.parse_args()
+
+    if args.config_file is not None:
+        config.merge_from_file(args.config_file)
+    config.merge_from_list(args.opts)
+
+    paths_catalog = import_file("lib.config.paths_catalog", config.PATHS_CATALOG, True)
+    info = paths_catalog.DatasetCatalog.get(args.dataset)
+
+    dataset = Front3D(info["file_list_path"], info["dataset_root_path"], fields=None)
+
+    data.write_packed_shard(Path(args.output_path), pack_samples(dataset), args.chunk_size * 1024 ** 2)
+
+
+if __name__ == '__main__':
+    main()